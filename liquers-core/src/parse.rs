@@ -6,8 +6,8 @@ use nom;
 extern crate nom_locate;
 use nom::branch::alt;
 use nom::character::complete::digit1;
-use nom::combinator::{eof, not, opt, peek};
-use nom::sequence::{preceded, terminated};
+use nom::combinator::{eof, not, opt, peek, recognize};
+use nom::sequence::{pair, preceded, terminated, tuple};
 use nom_locate::LocatedSpan;
 
 use nom::bytes::complete::{tag, take_while, take_while1};
@@ -34,20 +34,71 @@ impl<'a> From<Span<'a>> for Position {
     }
 }
 
+const ALPHA: u8 = 1;
+const DIGIT: u8 = 2;
+const UNDERSCORE: u8 = 4;
+const DOT: u8 = 8;
+const MINUS: u8 = 16;
+const PLUS: u8 = 32;
+
+const fn char_classes() -> [u8; 256] {
+    let mut table = [0u8; 256];
+    let mut i = 0;
+    while i < 256 {
+        let c = i as u8;
+        table[i] = if c.is_ascii_alphabetic() {
+            ALPHA
+        } else if c.is_ascii_digit() {
+            DIGIT
+        } else {
+            match c {
+                b'_' => UNDERSCORE,
+                b'.' => DOT,
+                b'-' => MINUS,
+                b'+' => PLUS,
+                _ => 0,
+            }
+        };
+        i += 1;
+    }
+    table
+}
+
+/// Character classes of the token characters, indexed by byte.
+/// Lets the token scanners find the end of a token with a single table lookup per character.
+static CHAR_CLASS: [u8; 256] = char_classes();
+
+/// Check if the character belongs to any of the classes.
+/// Like nom's is_alphanumeric(c as u8), letters and digits are checked on the character truncated to a byte.
+/// Punctuation ('_', '.', '-', '+') only matches the ASCII character itself.
+#[inline]
+fn is_class(c: char, classes: u8) -> bool {
+    let class = CHAR_CLASS[c as u8 as usize];
+    let class = if c.is_ascii() {
+        class
+    } else {
+        class & (ALPHA | DIGIT)
+    };
+    class & classes != 0
+}
+
 fn identifier(text: Span) -> IResult<Span, String> {
-    let (text, a) = take_while1(|c| is_alphabetic(c as u8) || c == '_')(text)?;
-    let (text, b) = take_while(|c| is_alphanumeric(c as u8) || c == '_')(text)?;
+    let (text, name) = recognize(pair(
+        take_while1(|c| is_class(c, ALPHA | UNDERSCORE)),
+        take_while(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE)),
+    ))(text)?;
 
-    Ok((text, format!("{}{}", a, b)))
+    Ok((text, name.to_string()))
 }
 
 fn filename(text: Span) -> IResult<Span, String> {
-    let (text, a) = take_while(|c| is_alphanumeric(c as u8) || c == '_')(text)?;
-    let (text, _dot) = nom::character::complete::char('.')(text)?;
-    let (text, b) =
-        take_while1(|c| is_alphanumeric(c as u8) || c == '_' || c == '.' || c == '-')(text)?;
+    let (text, name) = recognize(tuple((
+        take_while(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE)),
+        nom::character::complete::char('.'),
+        take_while1(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE | DOT | MINUS)),
+    )))(text)?;
 
-    Ok((text, format!("{}.{}", a, b)))
+    Ok((text, name.to_string()))
 }
 
 fn slash_filename(text: Span) -> IResult<Span, String> {
@@ -58,17 +109,17 @@ fn slash_filename(text: Span) -> IResult<Span, String> {
 
 fn resource_name(text: Span) -> IResult<Span, ResourceName> {
     let position: Position = text.into();
-    let (text, a) = take_while1(|c| is_alphanumeric(c as u8) || c == '_' || c == '.')(text)?;
-    let (text, b) =
-        take_while(|c| is_alphanumeric(c as u8) || c == '_' || c == '.' || c == '-')(text)?;
+    let (text, name) = recognize(pair(
+        take_while1(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE | DOT)),
+        take_while(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE | DOT | MINUS)),
+    ))(text)?;
     Ok((
         text,
-        ResourceName::new(format!("{}{}", a, b)).with_position(position),
+        ResourceName::new(name.to_string()).with_position(position),
     ))
 }
 fn parameter_text(text: Span) -> IResult<Span, String> {
-    let (text, a) =
-        take_while1(|c| is_alphanumeric(c as u8) || c == '_' || c == '+' || c == '.')(text)?;
+    let (text, a) = take_while1(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE | PLUS | DOT))(text)?;
     Ok((text, a.to_string()))
 }
 
@@ -162,7 +213,7 @@ fn action_request(text: Span) -> IResult<Span, ActionRequest> {
 fn header_parameter(text: Span) -> IResult<Span, HeaderParameter> {
     let (text, _) = tag("-")(text)?;
     let position: Position = text.into();
-    let (text, parameter) = take_while(|c| is_alphanumeric(c as u8) || c == '_' || c == '.')(text)?;
+    let (text, parameter) = take_while(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE | DOT))(text)?;
     Ok((
         text,
         HeaderParameter::new(parameter.to_string()).with_position(position),
@@ -174,7 +225,7 @@ fn full_transform_segment_header(text: Span) -> IResult<Span, SegmentHeader> {
     let (text, level_lead) = many1(tag("-"))(text)?;
     let (text, lead_name) =
         take_while1(|c: char| is_alphabetic(c as u8) && c.is_lowercase())(text)?;
-    let (text, rest_name) = take_while(|c| is_alphanumeric(c as u8) || c == '_')(text)?;
+    let (text, rest_name) = take_while(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE))(text)?;
     let (text, parameters) = many0(header_parameter)(text)?;
     let (text, _) = tag("/")(text)?;
 
@@ -218,7 +269,7 @@ fn resource_segment_header(text: Span) -> IResult<Span, SegmentHeader> {
     let position: Position = text.into();
     let (text, level_lead) = many1(tag("-"))(text)?;
     let (text, _) = tag("R")(text)?;
-    let (text, name) = take_while(|c: char| is_alphanumeric(c as u8) || c == '_')(text)?;
+    let (text, name) = take_while(|c| is_class(c, ALPHA | DIGIT | UNDERSCORE))(text)?;
     let (text, parameters) = many0(header_parameter)(text)?;
 
     Ok((
@@ -480,12 +531,21 @@ fn empty_query(text: Span) -> IResult<Span, Query> {
 }
 
 fn query_parser(text: Span) -> IResult<Span, Query> {
-    alt((
-        terminated(resource_transform_query, eof),
-        terminated(simple_transform_query, eof),
-        general_query,
-        empty_query,
-    ))(text)
+    // Dispatch on the first character after the optional leading "/".
+    // Resource-transform and simple transform queries can't start with "-" (segment header),
+    // so such queries go straight to the general query; an empty body can only be an empty query.
+    let fragment = *text.fragment();
+    let body = fragment.strip_prefix('/').unwrap_or(fragment);
+    match body.as_bytes().first() {
+        None => empty_query(text),
+        Some(b'-') => alt((general_query, empty_query))(text),
+        Some(_) => alt((
+            terminated(resource_transform_query, eof),
+            terminated(simple_transform_query, eof),
+            general_query,
+            empty_query,
+        ))(text),
+    }
 }
 /*
 fn parse_action(text:Span) ->IResult<Span, ActionRequest>{
@@ -501,7 +561,56 @@ fn parse_action_path(text: Span) -> IResult<Span, Vec<ActionRequest>> {
 }
 */
 
+/// Shortcut for queries that are obviously a single plain action name (e.g. "abc")
+/// or a single filename (e.g. "file.txt").
+/// Returns the same Query the full grammar would produce, or None if the query is not trivial.
+fn trivial_query(query: &str) -> Option<Query> {
+    let bytes = query.as_bytes();
+    let first = *bytes.first()?;
+    if !query.is_ascii() {
+        return None;
+    }
+    let segment = if is_class(first as char, ALPHA | UNDERSCORE)
+        && bytes
+            .iter()
+            .all(|&c| is_class(c as char, ALPHA | DIGIT | UNDERSCORE))
+    {
+        TransformQuerySegment {
+            header: None,
+            query: vec![ActionRequest::new(query.to_owned()).with_position(Span::new(query).into())],
+            filename: None,
+        }
+    } else {
+        let dot = bytes.iter().position(|&c| c == b'.')?;
+        if dot + 1 == bytes.len()
+            || !bytes[..dot]
+                .iter()
+                .all(|&c| is_class(c as char, ALPHA | DIGIT | UNDERSCORE))
+            || !bytes[dot + 1..]
+                .iter()
+                .all(|&c| is_class(c as char, ALPHA | DIGIT | UNDERSCORE | DOT | MINUS))
+        {
+            return None;
+        }
+        TransformQuerySegment {
+            header: None,
+            query: vec![],
+            filename: Some(
+                ResourceName::new(query.to_owned()).with_position(Span::new(query).into()),
+            ),
+        }
+    };
+    Some(Query {
+        segments: vec![QuerySegment::Transform(segment)],
+        absolute: false,
+        ..Default::default()
+    })
+}
+
 pub fn parse_query(query: &str) -> Result<Query, Error> {
+    if let Some(q) = trivial_query(query) {
+        return Ok(q);
+    }
     let (remainder, path) = query_parser(Span::new(query)).map_err(|e| {
         let message = format!("{}", e);
         Error::query_parse_error(query, &message, &Position::unknown())
@@ -607,6 +716,59 @@ mod tests {
         Ok(())
     }
 
+    #[test]
+    fn is_class_matches_punctuation_only_in_ascii() {
+        for c in (0..0x3000u32).filter_map(char::from_u32) {
+            assert_eq!(
+                is_class(c, ALPHA | DIGIT | UNDERSCORE | DOT | MINUS | PLUS),
+                is_alphanumeric(c as u8) || c == '_' || c == '.' || c == '-' || c == '+',
+                "{:?}",
+                c
+            );
+        }
+    }
+
+    #[test]
+    fn non_ascii_punctuation_lookalikes_rejected() {
+        // Low bytes of these characters are '_', '.' and '-' respectively.
+        assert!(parse_key("abş").is_err());
+        assert!(parse_key("dataЮcsv").is_err());
+        assert!(parse_key("abĭc").is_err());
+        assert!(parse_query("abş").is_err());
+        assert!(parse_query("dataЮcsv").is_err());
+        assert!(parse_query("abc-dЮe").is_err());
+    }
+
+    #[test]
+    fn trivial_query_test() -> Result<(), Box<dyn std::error::Error>> {
+        for query in [
+            "abc",
+            "_x1",
+            "file.txt",
+            "file1.tar.gz",
+            ".txt",
+            "1.csv",
+            "a.b-c",
+        ] {
+            let (_remainder, full) = query_parser(Span::new(query))?;
+            let fast = trivial_query(query).unwrap();
+            assert_eq!(format!("{:?}", fast), format!("{:?}", full));
+        }
+        for query in [
+            "",
+            "/abc",
+            "abc-def",
+            "abc/def",
+            "1abc",
+            "file.",
+            "-R",
+            "fíle.txt",
+        ] {
+            assert!(trivial_query(query).is_none());
+        }
+        Ok(())
+    }
+
     #[test]
     fn parse_query_test() -> Result<(), Error> {
         let path = parse_query("")?;
@@ -675,6 +837,18 @@ mod tests {
         Ok(())
     }
     #[test]
+    fn root_empty() -> Result<(), Error> {
+        let q = parse_query("/")?;
+        assert!(q.is_empty());
+        assert!(q.absolute);
+        assert_eq!(q.encode(), "/");
+        let q = parse_query("/-R/a/-/dr")?;
+        assert!(q.absolute);
+        assert_eq!(q.segments.len(), 2);
+        assert_eq!(q.encode(), "/-R/a/-/dr");
+        Ok(())
+    }
+    #[test]
     fn root1b() -> Result<(), Error> {
         let q = parse_query("-R")?;
         assert_eq!(q.segments.len(), 1);
@@ -664,14 +664,7 @@ impl Key {
 
     /// Return a parent key - i.e. a key without the last element.
     pub fn parent(&self) -> Self {
-        let mut key = Vec::new();
-        if self.is_empty() {
-            return Key(vec![]);
-        }
-        for x in self.iter().take(self.len() - 1) {
-            key.push(x.clone());
-        }
-        Key(key)
+        Key(self.0[..self.len().saturating_sub(1)].to_vec())
     }
 
     /// Convert a key to an absolute key - i.e. interpret "." and ".." elements.
@@ -1328,20 +1321,29 @@ impl Query {
     }
 
     /// Query without the filename.
+    /// Equivalent to the predecessor of a query with a filename,
+    /// but reuses the segments instead of cloning them.
     pub fn without_filename(self) -> Query {
-        if (&self).filename().is_none() {
-            self
-        } else {
-            if let (Some(p), _) = self.predecessor() {
-                p
-            } else {
-                Query {
-                    segments: vec![],
-                    absolute: self.absolute,
-                    ..Default::default()
-                }
+        let has_filename = match self.segments.last() {
+            None => false,
+            Some(QuerySegment::Transform(tqs)) => tqs.filename.is_some(),
+            Some(QuerySegment::Resource(rqs)) => !rqs.key.is_empty(),
+        };
+        if !has_filename {
+            return self;
+        }
+        let mut segments = self.segments;
+        match segments.last_mut() {
+            Some(QuerySegment::Transform(tqs)) if !tqs.query.is_empty() => tqs.filename = None,
+            _ => {
+                segments.pop();
             }
         }
+        Query {
+            segments,
+            absolute: self.absolute,
+            ..Default::default()
+        }
     }
 
     /// Make a shortened version of the at most n characters of a query for printout purposes
@@ -1617,6 +1619,25 @@ mod tests {
         assert_eq!(key.parent().parent().parent().parent().encode(), "");
     }
     #[test]
+    fn without_filename() {
+        for (query, expected) in [
+            ("", ""),
+            ("abc", "abc"),
+            ("file.txt", ""),
+            ("abc/file.txt", "abc"),
+            ("/-R/a/b", "/"),
+            ("-R/a/b/-/dr/file.txt", "-R/a/b/-/dr"),
+            ("-R/a/b/-/file.txt", "-R/a/b"),
+        ] {
+            let q = crate::parse::parse_query(query).unwrap();
+            let w = q.clone().without_filename();
+            assert_eq!(w.encode(), expected);
+            if let (Some(p), Some(_)) = (q.predecessor().0, q.filename()) {
+                assert_eq!(w, p);
+            }
+        }
+    }
+    #[test]
     fn test_key_extension() {
         let key = parse_key("").unwrap();
         assert_eq!(key.extension(), None);
@@ -75,7 +75,7 @@ impl Cache {
             .unwrap()
             .keys()
             .into_iter()
-            .map(|k| crate::parse::Query(k))
+            .map(|k| crate::parse::Query(k, None))
             .collect()
     }
 
@@ -32,6 +32,8 @@ fn liquers_py(py: Python, m: &PyModule) -> PyResult<()> {
     m.add_class::<Query>()?;
     m.add_function(wrap_pyfunction!(crate::parse::parse, m)?)?;
     m.add_function(wrap_pyfunction!(crate::parse::parse_key, m)?)?;
+    m.add_function(wrap_pyfunction!(crate::parse::encode_parsed, m)?)?;
+    m.add_function(wrap_pyfunction!(crate::parse::canonicalize, m)?)?;
 
     m.add_class::<crate::metadata::Metadata>()?;
 
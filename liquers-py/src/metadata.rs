@@ -32,7 +32,7 @@ impl Metadata {
     #[getter]
     pub fn query(&self) -> PyResult<crate::parse::Query> {
         match self.0.query() {
-            Ok(q) => Ok(crate::parse::Query(q)),
+            Ok(q) => Ok(crate::parse::Query(q, None)),
             Err(e) => Err(PyErr::new::<pyo3::exceptions::PyException, _>(
                 e.to_string(),
             )),
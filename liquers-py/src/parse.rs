@@ -1,7 +1,51 @@
-use std::{collections::hash_map::DefaultHasher, hash::{Hash, Hasher}};
+use std::{
+    collections::hash_map::DefaultHasher,
+    hash::{Hash, Hasher},
+    sync::Arc,
+};
 
 use pyo3::prelude::*;
+use pyo3::sync::GILOnceCell;
+use pyo3::types::PyString;
 
+/// Segment header names and encodings that occur in most queries.
+const COMMON_HEADER_STRINGS: [&str; 3] = ["", "-", "-R"];
+
+/// Python strings for COMMON_HEADER_STRINGS, created once.
+static COMMON_HEADER_PY_STRINGS: GILOnceCell<[Py<PyString>; 3]> = GILOnceCell::new();
+
+/// Return the shared Python string for COMMON_HEADER_STRINGS[index].
+fn common_header_string(py: Python, index: usize) -> Py<PyString> {
+    COMMON_HEADER_PY_STRINGS.get_or_init(py, || {
+        COMMON_HEADER_STRINGS.map(|s| PyString::intern_bound(py, s).unbind())
+    })[index]
+        .clone_ref(py)
+}
+
+/// Encode an optional segment header as a Python string.
+/// The common headers ("", "-" and "-R") are returned without encoding them first.
+fn encoded_header_string(
+    py: Python,
+    header: Option<&liquers_core::query::SegmentHeader>,
+) -> Py<PyString> {
+    match header {
+        None => common_header_string(py, 0),
+        Some(h) if h.level == 0 && h.name.is_empty() && h.parameters.is_empty() => {
+            common_header_string(py, if h.resource { 2 } else { 1 })
+        }
+        Some(h) => PyString::new_bound(py, &h.encode()).unbind(),
+    }
+}
+
+/// Convert a segment header name or encoding to a Python string.
+/// The common ones are created once and shared; anything else
+/// (user supplied names and parameters) gets a new string.
+fn header_string(py: Python, s: &str) -> Py<PyString> {
+    match COMMON_HEADER_STRINGS.iter().position(|&c| c == s) {
+        Some(index) => common_header_string(py, index),
+        None => PyString::new_bound(py, s).unbind(),
+    }
+}
 
 #[pyclass]
 #[derive(Clone)]
@@ -167,8 +211,8 @@ impl SegmentHeader {
         SegmentHeader(liquers_core::query::SegmentHeader::new())
     }
     #[getter]
-    pub fn name(&self) -> String {
-        self.0.name.to_string()
+    pub fn name(&self, py: Python) -> Py<PyString> {
+        header_string(py, &self.0.name)
     }
 
     #[getter]
@@ -196,8 +240,8 @@ impl SegmentHeader {
         self.0.is_trivial()
     }
 
-    pub fn encode(&self) -> String {
-        self.0.encode()
+    pub fn encode(&self, py: Python) -> Py<PyString> {
+        encoded_header_string(py, Some(&self.0))
     }
 
     pub fn __repr__(&self) -> String {
@@ -362,10 +406,10 @@ impl ResourceQuerySegment {
         }
     }
 
-    pub fn segment_name(&self) -> String {
+    pub fn segment_name(&self, py: Python) -> Py<PyString> {
         match self.0.header {
-            Some(ref h) => h.name.to_string(),
-            None => "".to_string(),
+            Some(ref h) => header_string(py, &h.name),
+            None => header_string(py, ""),
         }
     }
 
@@ -485,15 +529,75 @@ impl QuerySegment {
     }
 }
 
+/// Predecessor and remainder of a query as Python objects.
+type PyPredecessor = (Option<Py<Query>>, Option<Py<QuerySegment>>);
+
+fn clone_predecessor(py: Python, (p, r): &PyPredecessor) -> PyPredecessor {
+    (
+        p.as_ref().map(|q| q.clone_ref(py)),
+        r.as_ref().map(|s| s.clone_ref(py)),
+    )
+}
+
+/// Predecessors of a query created with parse(query, memoize=True).
+/// The Python objects are created on first use; later calls return the same objects.
+pub struct PredecessorCache {
+    predecessor: GILOnceCell<PyPredecessor>,
+    all_predecessors: GILOnceCell<Vec<PyPredecessor>>,
+}
+
+impl Default for PredecessorCache {
+    fn default() -> Self {
+        PredecessorCache {
+            predecessor: GILOnceCell::new(),
+            all_predecessors: GILOnceCell::new(),
+        }
+    }
+}
+
+/// Query wrapper. The second element is the predecessor cache;
+/// it is None unless memoization was requested.
 #[pyclass]
 #[derive(Clone)]
-pub struct Query(pub liquers_core::query::Query);
+pub struct Query(
+    pub liquers_core::query::Query,
+    pub Option<Arc<PredecessorCache>>,
+);
+
+impl Query {
+    /// Wrap a query derived from this one, memoizing if this query memoizes.
+    fn derived(&self, query: liquers_core::query::Query) -> Query {
+        Query(query, self.1.as_ref().map(|_| Arc::default()))
+    }
+
+    fn to_py_predecessor(
+        &self,
+        py: Python,
+        (p, r): (
+            Option<liquers_core::query::Query>,
+            Option<liquers_core::query::QuerySegment>,
+        ),
+    ) -> PyResult<PyPredecessor> {
+        Ok((
+            p.map(|q| Py::new(py, self.derived(q))).transpose()?,
+            r.map(|s| Py::new(py, QuerySegment(s))).transpose()?,
+        ))
+    }
+
+    fn new_all_predecessors(&self, py: Python) -> PyResult<Vec<PyPredecessor>> {
+        self.0
+            .all_predecessors()
+            .into_iter()
+            .map(|x| self.to_py_predecessor(py, x))
+            .collect()
+    }
+}
 
 #[pymethods]
 impl Query {
     #[new]
     pub fn new() -> Self {
-        Query(liquers_core::query::Query::default())
+        Query(liquers_core::query::Query::default(), None)
     }
 
     #[getter]
@@ -510,12 +614,50 @@ impl Query {
             .collect()
     }
 
+    /// Encoded headers of all segments ("" for a segment without a header).
+    /// Unlike segments, this does not create a QuerySegment and SegmentHeader object per segment.
+    /// The list is built on each access; the common headers are shared strings.
+    #[getter]
+    pub fn segment_headers_encoded(&self, py: Python) -> Vec<Py<PyString>> {
+        self.0
+            .segments
+            .iter()
+            .map(|s| {
+                let header = match s {
+                    liquers_core::query::QuerySegment::Transform(t) => t.header.as_ref(),
+                    liquers_core::query::QuerySegment::Resource(r) => r.header.as_ref(),
+                };
+                encoded_header_string(py, header)
+            })
+            .collect()
+    }
+
+    /// Filenames of all segments (None for a segment without a filename).
+    #[getter]
+    pub fn segment_filenames(&self) -> Vec<Option<String>> {
+        self.0
+            .segments
+            .iter()
+            .map(|s| s.filename().map(|f| f.encode().to_string()))
+            .collect()
+    }
+
+    /// For each segment, true if it is a resource query segment, false if it is a transform query segment.
+    #[getter]
+    pub fn segment_is_resource(&self) -> Vec<bool> {
+        self.0
+            .segments
+            .iter()
+            .map(|s| s.is_resource_query_segment())
+            .collect()
+    }
+
     pub fn filename(&self) -> Option<String> {
         self.0.filename().map(|s| s.to_string())
     }
 
     pub fn without_filename(&self) -> Query {
-        Query(self.0.clone().without_filename())
+        self.derived(self.0.clone().without_filename())
     }
 
     pub fn extension(&self) -> Option<String> {
@@ -554,17 +696,63 @@ impl Query {
         }
     }
 
-    pub fn predecessor(&self) -> (Option<Query>, Option<QuerySegment>) {
-        let (p, r) = self.0.predecessor();
-        (p.map(|s| Query(s)), r.map(|s| QuerySegment(s)))
+    pub fn predecessor(&self, py: Python) -> PyResult<PyPredecessor> {
+        match &self.1 {
+            Some(cache) => {
+                let predecessor = cache
+                    .predecessor
+                    .get_or_try_init(py, || self.to_py_predecessor(py, self.0.predecessor()))?;
+                Ok(clone_predecessor(py, predecessor))
+            }
+            None => self.to_py_predecessor(py, self.0.predecessor()),
+        }
     }
 
-    pub fn all_predecessors(&self) -> Vec<(Option<Query>, Option<QuerySegment>)> {
-        self.0
-            .all_predecessors()
-            .into_iter()
-            .map(|(p, r)| (p.map(|s| Query(s)), r.map(|s| QuerySegment(s))))
-            .collect()
+    pub fn all_predecessors(&self, py: Python) -> PyResult<Vec<PyPredecessor>> {
+        match &self.1 {
+            Some(cache) => {
+                let all_predecessors = cache
+                    .all_predecessors
+                    .get_or_try_init(py, || self.new_all_predecessors(py))?;
+                Ok(all_predecessors
+                    .iter()
+                    .map(|x| clone_predecessor(py, x))
+                    .collect())
+            }
+            None => self.new_all_predecessors(py),
+        }
+    }
+
+    /// Return all predecessors and remainders (see all_predecessors) as two lists of encoded strings.
+    /// This avoids creating a Query and QuerySegment object for every predecessor step.
+    pub fn all_predecessors_encoded(&self) -> (Vec<String>, Vec<Option<String>>) {
+        let mut predecessors = vec![];
+        let mut remainders = vec![];
+        for (p, r) in self.0.all_predecessors() {
+            let p = p.expect("all_predecessors always returns a predecessor");
+            predecessors.push(p.encode());
+            remainders.push(r.map(|s| s.encode()));
+        }
+        (predecessors, remainders)
+    }
+
+    /// Walk the predecessor() chain and return it as a list of (predecessor, remainder, flags) tuples,
+    /// with predecessor and remainder encoded.
+    /// Flags describe the remainder: bit 0 - is_empty, bit 1 - is_filename, bit 2 - is_action_request
+    /// (0 if there is no remainder).
+    pub fn debug_chain(&self) -> Vec<(String, Option<String>, u8)> {
+        let mut chain = vec![];
+        let (mut p, mut r) = self.0.predecessor();
+        while let Some(q) = p {
+            let flags = r.as_ref().map_or(0, |r| {
+                (r.is_empty() as u8)
+                    | ((r.is_filename() as u8) << 1)
+                    | ((r.is_action_request() as u8) << 2)
+            });
+            chain.push((q.encode(), r.map(|s| s.encode()), flags));
+            (p, r) = q.predecessor();
+        }
+        chain
     }
 
     //#[args(n = 30)]
@@ -577,7 +765,7 @@ impl Query {
     }
 
     pub fn to_absolute(&self, cwd_key:&Key) -> Query {
-        Query(self.0.to_absolute(&cwd_key.0))
+        self.derived(self.0.to_absolute(&cwd_key.0))
     }
 
     pub fn __repr__(&self) -> String {
@@ -604,10 +792,16 @@ impl Query {
 
 }
 
+/// Parse a query.
+/// With memoize=True, predecessor() and all_predecessors() of the query (and of the queries derived from it)
+/// create their result objects once and return the same objects on later calls,
+/// so walking the same predecessor chain repeatedly does not recompute it.
+/// This adds overhead for queries whose predecessors are needed only once.
 #[pyfunction]
-pub fn parse(query: &str) -> PyResult<Query> {
+#[pyo3(signature = (query, memoize = false))]
+pub fn parse(query: &str, memoize: bool) -> PyResult<Query> {
     match liquers_core::parse::parse_query(query) {
-        Ok(q) => Ok(Query(q)),
+        Ok(q) => Ok(Query(q, if memoize { Some(Arc::default()) } else { None })),
         Err(e) => Err(PyErr::new::<pyo3::exceptions::PyException, _>(
             e.to_string(),
         )),
@@ -624,3 +818,256 @@ pub fn parse_key(key: &str) -> PyResult<Key> {
     }
 }
 
+/// Parse a query and return its canonical encoding.
+/// Same as parse(query).encode(), without creating a Query object.
+#[pyfunction]
+pub fn encode_parsed(query: &str) -> PyResult<String> {
+    match liquers_core::parse::parse_query(query) {
+        Ok(q) => Ok(q.encode()),
+        Err(e) => Err(PyErr::new::<pyo3::exceptions::PyException, _>(
+            e.to_string(),
+        )),
+    }
+}
+
+/// Parse a query, make it absolute relative to the cwd key and return its canonical encoding.
+/// Same as parse(query).to_absolute(parse_key(cwd)).encode(), without creating Query and Key objects.
+#[pyfunction]
+pub fn canonicalize(query: &str, cwd: &str) -> PyResult<String> {
+    let cwd_key = parse_key(cwd)?;
+    match liquers_core::parse::parse_query(query) {
+        Ok(q) => Ok(q.to_absolute(&cwd_key.0).encode()),
+        Err(e) => Err(PyErr::new::<pyo3::exceptions::PyException, _>(
+            e.to_string(),
+        )),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn with_python<F, R>(f: F) -> R
+    where
+        F: for<'py> FnOnce(Python<'py>) -> R,
+    {
+        pyo3::prepare_freethreaded_python();
+        Python::with_gil(f)
+    }
+
+    #[test]
+    fn all_predecessors_encoded() -> PyResult<()> {
+        let (p, r) = parse("ghi/jkl/file.txt", false)?.all_predecessors_encoded();
+        assert_eq!(p, vec!["ghi/jkl/file.txt", "ghi/jkl", "ghi"]);
+        assert_eq!(
+            r,
+            vec![
+                None,
+                Some("file.txt".to_owned()),
+                Some("jkl/file.txt".to_owned())
+            ]
+        );
+        for query in [
+            "ghi/jkl/file.txt",
+            "-R/abc/def/-x/ghi/jkl/file.txt",
+            "-R/a/b/-/c/d",
+            "",
+        ] {
+            let q = parse(query, false)?;
+            let expected: (Vec<_>, Vec<_>) =
+                q.0.all_predecessors()
+                    .into_iter()
+                    .map(|(p, r)| (p.unwrap().encode(), r.map(|s| s.encode())))
+                    .unzip();
+            assert_eq!(q.all_predecessors_encoded(), expected);
+        }
+        Ok(())
+    }
+
+    #[test]
+    fn segment_getters() -> PyResult<()> {
+        with_python(|py| {
+            let q = parse("-R/abc/def/-x/ghi/jkl/file.txt", false)?;
+            let headers: Vec<String> = q
+                .segment_headers_encoded(py)
+                .iter()
+                .map(|h| h.extract(py))
+                .collect::<PyResult<_>>()?;
+            assert_eq!(headers, vec!["-R", "-x"]);
+            assert_eq!(
+                q.segment_filenames(),
+                vec![Some("def".to_owned()), Some("file.txt".to_owned())]
+            );
+            assert_eq!(q.segment_is_resource(), vec![true, false]);
+
+            for query in [
+                "-R/abc/def/-x/ghi/jkl/file.txt",
+                "ghi/jkl/file.txt",
+                "abc/def/-/xxx",
+                "-R/a/b/-/c/d",
+                "-Rx-p/abc/-y/d",
+                "",
+            ] {
+                let q = parse(query, false)?;
+                let segments = q.segments();
+                let headers: Vec<String> = q
+                    .segment_headers_encoded(py)
+                    .iter()
+                    .map(|h| h.extract(py))
+                    .collect::<PyResult<_>>()?;
+                let expected_headers: Vec<String> = segments
+                    .iter()
+                    .map(|s| s.header().map_or(String::new(), |h| h.0.encode()))
+                    .collect();
+                assert_eq!(headers, expected_headers);
+                let expected_filenames: Vec<_> = segments.iter().map(|s| s.filename()).collect();
+                assert_eq!(q.segment_filenames(), expected_filenames);
+                let expected_kinds: Vec<_> = segments
+                    .iter()
+                    .map(|s| s.is_resource_query_segment())
+                    .collect();
+                assert_eq!(q.segment_is_resource(), expected_kinds);
+            }
+            Ok(())
+        })
+    }
+
+    #[test]
+    fn common_header_strings_shared() -> PyResult<()> {
+        with_python(|py| {
+            let q = parse("-R/a/-/b/-Rx-p/c", false)?;
+            let first = q.segment_headers_encoded(py);
+            let second = q.segment_headers_encoded(py);
+            let headers: Vec<String> = first
+                .iter()
+                .map(|h| h.extract(py))
+                .collect::<PyResult<_>>()?;
+            assert_eq!(headers, vec!["-R", "-", "-Rx-p"]);
+            assert!(first[0].is(&second[0]));
+            assert!(first[1].is(&second[1]));
+            Ok(())
+        })
+    }
+
+    #[test]
+    fn memoized_predecessors() -> PyResult<()> {
+        with_python(|py| {
+            for query in [
+                "ghi/jkl/file.txt",
+                "-x/ghi/jkl/file.txt",
+                "-R/abc/def/-x/ghi/jkl/file.txt",
+                "",
+            ] {
+                let plain = parse(query, false)?;
+                let memoized = parse(query, true)?;
+
+                let encode = |(p, r): &PyPredecessor| {
+                    (
+                        p.as_ref().map(|q| q.borrow(py).encode()),
+                        r.as_ref().map(|s| s.borrow(py).encode()),
+                    )
+                };
+                let expected: Vec<_> = plain.all_predecessors(py)?.iter().map(encode).collect();
+                let first = memoized.all_predecessors(py)?;
+                let second = memoized.all_predecessors(py)?;
+                assert_eq!(first.iter().map(encode).collect::<Vec<_>>(), expected);
+                for (a, b) in first.iter().zip(second.iter()) {
+                    assert!(a.0.as_ref().unwrap().is(b.0.as_ref().unwrap()));
+                }
+
+                // Walk the predecessor chain twice; the second walk returns the same objects.
+                let walk = |q: &Query| -> PyResult<Vec<PyPredecessor>> {
+                    let mut chain = vec![];
+                    let mut x = q.predecessor(py)?;
+                    while let Some(p) = x.0.as_ref().map(|p| p.clone_ref(py)) {
+                        chain.push(x);
+                        x = p.borrow(py).predecessor(py)?;
+                    }
+                    Ok(chain)
+                };
+                let expected: Vec<_> = walk(&plain)?.iter().map(encode).collect();
+                let first = walk(&memoized)?;
+                let second = walk(&memoized)?;
+                assert_eq!(first.iter().map(encode).collect::<Vec<_>>(), expected);
+                assert_eq!(first.len(), second.len());
+                for (a, b) in first.iter().zip(second.iter()) {
+                    assert!(a.0.as_ref().unwrap().is(b.0.as_ref().unwrap()));
+                }
+            }
+            Ok(())
+        })
+    }
+
+    #[test]
+    fn debug_chain() -> PyResult<()> {
+        with_python(|_py| {
+            let q = parse("ghi/jkl/file.txt", false)?;
+            assert_eq!(
+                q.debug_chain(),
+                vec![
+                    ("ghi/jkl".to_string(), Some("file.txt".to_string()), 0b010),
+                    ("ghi".to_string(), Some("jkl".to_string()), 0b100),
+                    ("".to_string(), Some("ghi".to_string()), 0b100),
+                ]
+            );
+            for query in [
+                "ghi/jkl/file.txt",
+                "-x/ghi/jkl/file.txt",
+                "-R/abc/def/-x/ghi/jkl/file.txt",
+                "-R/abc/def",
+                "",
+            ] {
+                let q = parse(query, false)?;
+                let mut expected = vec![];
+                let (mut p, mut r) = q.0.predecessor();
+                while let Some(pq) = p {
+                    let flags = r.as_ref().map_or(0, |r| {
+                        let mut flags = 0;
+                        if r.is_empty() {
+                            flags |= 1;
+                        }
+                        if r.is_filename() {
+                            flags |= 2;
+                        }
+                        if r.is_action_request() {
+                            flags |= 4;
+                        }
+                        flags
+                    });
+                    expected.push((pq.encode(), r.map(|s| s.encode()), flags));
+                    (p, r) = pq.predecessor();
+                }
+                assert_eq!(q.debug_chain(), expected);
+            }
+            Ok(())
+        })
+    }
+
+    #[test]
+    fn encode_parsed_and_canonicalize() -> PyResult<()> {
+        with_python(|_py| {
+            assert_eq!(encode_parsed("abc/def/file.txt")?, "abc/def/file.txt");
+            assert_eq!(canonicalize("-R/./x", "a/b/c")?, "-R/a/b/c/x");
+            assert_eq!(canonicalize("-R/../x", "a/b/c")?, "-R/a/b/x");
+            for query in [
+                "",
+                "abc/def/file.txt",
+                "-R/./x/-/dr",
+                "/-R/../x/file.txt",
+                "-R/abc/def/-x/ghi/jkl/file.txt",
+            ] {
+                assert_eq!(encode_parsed(query)?, parse(query, false)?.encode());
+                for cwd in ["", "a/b/c"] {
+                    assert_eq!(
+                        canonicalize(query, cwd)?,
+                        parse(query, false)?.to_absolute(&parse_key(cwd)?).encode()
+                    );
+                }
+            }
+            assert!(encode_parsed("abş").is_err());
+            assert!(canonicalize("abş", "a/b/c").is_err());
+            assert!(canonicalize("-R/x", "abş").is_err());
+            Ok(())
+        })
+    }
+}